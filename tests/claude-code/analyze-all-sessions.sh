@@ -6,6 +6,8 @@
 #   ./analyze-all-sessions.sh /path/to/test/dir  # Analyze specific test run
 #   ./analyze-all-sessions.sh --list             # List available test runs
 #   ./analyze-all-sessions.sh --json             # Output combined JSON
+#   ./analyze-all-sessions.sh --all-runs --save-baseline baseline.json  # Record per-test aggregates
+#   ./analyze-all-sessions.sh --baseline baseline.json /path/to/new/run  # Fail on token regressions
 
 set -euo pipefail
 
@@ -22,7 +24,13 @@ NC='\033[0m'
 # Parse arguments
 OUTPUT_JSON=false
 LIST_RUNS=false
-TEST_DIR=""
+TEST_DIRS=()
+ALL_RUNS=false
+PRICING=""
+SAVE_BASELINE=""
+BASELINE=""
+TOLERANCE_ARGS=()
+ALLOW_MISSING=false
 
 while [[ $# -gt 0 ]]; do
     case $1 in
@@ -34,27 +42,65 @@ while [[ $# -gt 0 ]]; do
             LIST_RUNS=true
             shift
             ;;
+        --save-baseline)
+            SAVE_BASELINE="$2"
+            shift 2
+            ;;
+        --baseline)
+            BASELINE="$2"
+            shift 2
+            ;;
+        --all-runs)
+            ALL_RUNS=true
+            shift
+            ;;
+        --pricing)
+            PRICING="$2"
+            shift 2
+            ;;
+        --tolerance|--metric-tolerance)
+            TOLERANCE_ARGS+=("$1" "$2")
+            shift 2
+            ;;
+        --allow-missing)
+            ALLOW_MISSING=true
+            shift
+            ;;
         --help|-h)
-            echo "Usage: $0 [options] [test-dir]"
+            echo "Usage: $0 [options] [test-dir ...]"
             echo ""
             echo "Analyze token usage for all sessions from a test run."
             echo ""
             echo "Options:"
             echo "  --json     Output combined JSON instead of tables"
             echo "  --list     List available test runs"
+            echo "  --all-runs Use every run in $TEST_OUTPUT_BASE"
+            echo "  --pricing FILE             Pricing table JSON (default: model-pricing.json)"
+            echo "  --save-baseline FILE       Save per-test token/message aggregates"
+            echo "  --baseline FILE            Compare against a saved baseline, exit 1 on regression"
+            echo "                             or when a baseline test was not run; sessions the"
+            echo "                             baseline was saved from, or older, are skipped"
+            echo "  --tolerance PCT            Allowed increase for every metric (default: 25)"
+            echo "  --metric-tolerance M=PCT   Override one metric (total_tokens, output_tokens,"
+            echo "                             cost_usd, messages); may be repeated"
+            echo "  --allow-missing            Do not fail on baseline tests that were not run"
             echo "  --help     Show this help"
             echo ""
             echo "Arguments:"
-            echo "  test-dir   Path to test output directory (default: most recent)"
+            echo "  test-dir   Path to test output directory (default: most recent)."
+            echo "             Baseline modes accept several; tests are pooled by suite/test name."
             echo ""
             echo "Examples:"
             echo "  $0                              # Analyze most recent run"
             echo "  $0 --list                       # List all test runs"
             echo "  $0 /tmp/cc-plugins-tests/20260116_181200"
+            echo "  $0 --all-runs --save-baseline tests/token-baseline.json"
+            echo "  $0 --baseline tests/token-baseline.json --metric-tolerance cost_usd=40 \\"
+            echo "      /tmp/cc-plugins-tests/20260116_181200"
             exit 0
             ;;
         *)
-            TEST_DIR="$1"
+            TEST_DIRS+=("$1")
             shift
             ;;
     esac
@@ -75,21 +121,66 @@ if [ "$LIST_RUNS" = true ]; then
     exit 0
 fi
 
-# Find test directory
-if [ -z "$TEST_DIR" ]; then
+# Validate baseline options
+if [ -n "$SAVE_BASELINE" ] && [ -n "$BASELINE" ]; then
+    echo "Error: --save-baseline and --baseline cannot be combined"
+    exit 1
+fi
+
+if [ -n "$SAVE_BASELINE" ] && { [ ${#TOLERANCE_ARGS[@]} -gt 0 ] || [ "$ALLOW_MISSING" = true ]; }; then
+    echo "Error: --tolerance, --metric-tolerance and --allow-missing only apply to --baseline"
+    exit 1
+fi
+
+# Baselines store token counts, not costs, so saving takes no pricing or JSON output
+if [ -n "$SAVE_BASELINE" ] && { [ "$OUTPUT_JSON" = true ] || [ -n "$PRICING" ]; }; then
+    echo "Error: --json and --pricing only apply to --baseline"
+    exit 1
+fi
+
+# Find test directories
+if [ "$ALL_RUNS" = true ]; then
+    TEST_DIRS+=("$TEST_OUTPUT_BASE")
+fi
+
+if [ ${#TEST_DIRS[@]} -eq 0 ]; then
     if [ ! -d "$TEST_OUTPUT_BASE" ]; then
         echo "Error: No test runs found in $TEST_OUTPUT_BASE"
         echo "Run some tests first: ./tests/run-tests.sh --all"
         exit 1
     fi
     # Get most recent
-    TEST_DIR="$TEST_OUTPUT_BASE/$(ls -1t "$TEST_OUTPUT_BASE" | head -1)"
+    TEST_DIRS=("$TEST_OUTPUT_BASE/$(ls -1t "$TEST_OUTPUT_BASE" | head -1)")
+fi
+
+for dir in "${TEST_DIRS[@]}"; do
+    if [ ! -d "$dir" ]; then
+        echo "Error: Test directory not found: $dir"
+        exit 1
+    fi
+done
+
+# Baseline modes analyze every session in one process and exit with its status
+if [ -n "$SAVE_BASELINE" ]; then
+    exec python3 "$SCRIPT_DIR/token-baseline.py" save "$SAVE_BASELINE" "${TEST_DIRS[@]}"
 fi
 
-if [ ! -d "$TEST_DIR" ]; then
-    echo "Error: Test directory not found: $TEST_DIR"
+if [ -n "$BASELINE" ]; then
+    COMPARE_ARGS=(${TOLERANCE_ARGS[@]+"${TOLERANCE_ARGS[@]}"})
+    [ "$ALLOW_MISSING" = true ] && COMPARE_ARGS+=(--allow-missing)
+    [ "$OUTPUT_JSON" = true ] && COMPARE_ARGS+=(--json)
+    [ -n "$PRICING" ] && COMPARE_ARGS+=(--pricing "$PRICING")
+    exec python3 "$SCRIPT_DIR/token-baseline.py" compare "$BASELINE" "${TEST_DIRS[@]}" ${COMPARE_ARGS[@]+"${COMPARE_ARGS[@]}"}
+fi
+
+if [ ${#TEST_DIRS[@]} -gt 1 ]; then
+    echo "Error: Only baseline modes accept several test directories"
     exit 1
 fi
+TEST_DIR="${TEST_DIRS[0]}"
+
+ANALYZE_ARGS=()
+[ -n "$PRICING" ] && ANALYZE_ARGS+=(--pricing "$PRICING")
 
 echo "========================================"
 echo " Token Usage Analysis"
@@ -138,7 +229,7 @@ for session_file in $SESSION_FILES; do
         echo "    \"test\": \"$test_name\","
         echo "    \"file\": \"$session_file\","
         # Get JSON analysis
-        analysis=$(python3 "$SCRIPT_DIR/analyze-token-usage.py" --json "$session_file" 2>/dev/null || echo '{}')
+        analysis=$(python3 "$SCRIPT_DIR/analyze-token-usage.py" ${ANALYZE_ARGS[@]+"${ANALYZE_ARGS[@]}"} --json "$session_file" 2>/dev/null || echo '{}')
         echo "    \"analysis\": $analysis"
         echo -n "  }"
     else
@@ -147,9 +238,9 @@ for session_file in $SESSION_FILES; do
         echo "----------------------------------------"
 
         # Run analysis
-        if python3 "$SCRIPT_DIR/analyze-token-usage.py" "$session_file" 2>/dev/null; then
+        if python3 "$SCRIPT_DIR/analyze-token-usage.py" ${ANALYZE_ARGS[@]+"${ANALYZE_ARGS[@]}"} "$session_file" 2>/dev/null; then
             # Extract totals for summary (parse from JSON)
-            totals=$(python3 "$SCRIPT_DIR/analyze-token-usage.py" --json "$session_file" 2>/dev/null | grep -A20 '"totals"')
+            totals=$(python3 "$SCRIPT_DIR/analyze-token-usage.py" ${ANALYZE_ARGS[@]+"${ANALYZE_ARGS[@]}"} --json "$session_file" 2>/dev/null | grep -A20 '"totals"')
             input=$(echo "$totals" | grep '"input_tokens"' | grep -o '[0-9]*' | head -1 || echo "0")
             output=$(echo "$totals" | grep '"output_tokens"' | grep -o '[0-9]*' | head -1 || echo "0")
             cache=$(echo "$totals" | grep '"cache_read"' | grep -o '[0-9]*' | head -1 || echo "0")
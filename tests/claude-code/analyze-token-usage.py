@@ -5,28 +5,193 @@ Breaks down usage by main session and individual subagents.
 
 Adapted from superpowers for cc-plugins testing.
 
+Tool latency is measured by pairing each tool_use block with its tool_result
+(by id) and diffing entry timestamps; sessions without timestamps (e.g. raw
+stream-json output) simply report no timing.
+
+Costs are priced per model: each assistant entry's `message.model` is looked
+up in model-pricing.json (input, output, cache-write and cache-read rates).
+
+For very large sessions, --stream writes JSON-lines records as subagents and
+skills are aggregated instead of holding them all, and --top K keeps only the
+K most expensive of each in a bounded heap.
+
 Usage:
     python3 analyze-token-usage.py <session-file.jsonl>
     python3 analyze-token-usage.py --json <session-file.jsonl>  # Output as JSON
+    python3 analyze-token-usage.py --pricing rates.json <session-file.jsonl>
+    python3 analyze-token-usage.py --stream <session-file.jsonl>  # JSON lines
+    python3 analyze-token-usage.py --top 10 <session-file.jsonl>
 """
 
+import heapq
+import itertools
 import json
+import random
 import sys
+from datetime import datetime
 from pathlib import Path
 from collections import defaultdict
-from typing import Dict, Any, Tuple
+from typing import Dict, Any, Callable, List, Optional, Tuple, Union
 import argparse
 
+DEFAULT_PRICING_FILE = Path(__file__).with_name('model-pricing.json')
+UNKNOWN_MODEL = 'unknown'
+
+# Latency samples kept per tool; beyond this, percentiles come from a uniform
+# reservoir sample so memory stays fixed however many calls a session makes.
+# Seeded so repeated runs on the same file report the same percentiles.
+LATENCY_SAMPLE_LIMIT = 10_000
+_latency_rng = random.Random(0)
+
+# Models already warned about being priced at the default rates
+_defaulted_models = set()
+
+# Breaks cost ties in the top-K heaps so records themselves are never compared
+_heap_sequence = itertools.count()
+
+
+def empty_usage() -> Dict[str, Any]:
+    """Zeroed token counts with an empty per-model breakdown."""
+    return {
+        'input_tokens': 0,
+        'output_tokens': 0,
+        'cache_creation': 0,
+        'cache_read': 0,
+        'messages': 0,
+        'by_model': {}
+    }
+
+
+def add_usage(usage: Dict[str, Any], model: str, api_usage: Dict[str, int]) -> None:
+    """Add one API usage record to an agent's totals and its per-model breakdown."""
+    per_model = usage['by_model'].setdefault(model, {
+        'input_tokens': 0,
+        'output_tokens': 0,
+        'cache_creation': 0,
+        'cache_read': 0,
+        'messages': 0
+    })
+    for target in (usage, per_model):
+        target['messages'] += 1
+        target['input_tokens'] += api_usage.get('input_tokens', 0) or 0
+        target['output_tokens'] += api_usage.get('output_tokens', 0) or 0
+        target['cache_creation'] += api_usage.get('cache_creation_input_tokens', 0) or 0
+        target['cache_read'] += api_usage.get('cache_read_input_tokens', 0) or 0
+
+
+def merge_usage(target: Dict[str, Any], source: Dict[str, Any]) -> None:
+    """Sum one agent's token counts and per-model breakdown into another's."""
+    for key in ('input_tokens', 'output_tokens', 'cache_creation', 'cache_read', 'messages'):
+        target[key] += source[key]
+    merge_by_model(target['by_model'], source['by_model'])
+
+
+def merge_by_model(target: Dict[str, Dict[str, int]], source: Dict[str, Dict[str, int]]) -> None:
+    """Sum a per-model breakdown into another one."""
+    for model, usage in source.items():
+        merged = target.setdefault(model, {key: 0 for key in usage})
+        for key, value in usage.items():
+            merged[key] += value
+
+
+def parse_timestamp(value: Any) -> Optional[float]:
+    """Parse an ISO-8601 entry timestamp into epoch seconds (None if absent)."""
+    if not isinstance(value, str):
+        return None
+    try:
+        return datetime.fromisoformat(value.replace('Z', '+00:00')).timestamp()
+    except ValueError:
+        return None
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """Linear-interpolated percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = (len(sorted_values) - 1) * pct / 100
+    lower = int(rank)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (rank - lower)
+
+
+def record_latency(timing: Dict[str, Any], name: str, latency: float) -> None:
+    """Add one tool latency to the per-tool stats and its bounded sample."""
+    stats = timing['tool_stats'].setdefault(name, {'calls': 0, 'total_seconds': 0.0, 'max_seconds': 0.0})
+    stats['calls'] += 1
+    stats['total_seconds'] += latency
+    stats['max_seconds'] = max(stats['max_seconds'], latency)
+
+    samples = timing['tool_latencies'][name]
+    if len(samples) < LATENCY_SAMPLE_LIMIT:
+        samples.append(latency)
+    else:
+        slot = _latency_rng.randrange(stats['calls'])
+        if slot < LATENCY_SAMPLE_LIMIT:
+            samples[slot] = latency
+
+
+def push_top_k(heap: List[Tuple[float, int, Dict[str, Any]]], k: int, cost: float, record: Dict[str, Any]) -> None:
+    """Keep the k most expensive records in a min-heap (cheapest at heap[0])."""
+    item = (cost, next(_heap_sequence), record)
+    if len(heap) < k:
+        heapq.heappush(heap, item)
+    elif cost > heap[0][0]:
+        heapq.heapreplace(heap, item)
+
+
+def tool_use_id_of(data: Dict[str, Any]) -> Any:
+    """Return the tool_use_id a user entry is answering, if any."""
+    content = data.get('message', {}).get('content', [])
+    if isinstance(content, list):
+        for block in content:
+            if isinstance(block, dict) and block.get('type') == 'tool_result':
+                return block.get('tool_use_id')
+    return None
+
+
+def analyze_main_session(filepath: str, pricing: Optional[Dict[str, Any]] = None,
+                         top_k: Optional[int] = None,
+                         on_record: Optional[Callable[[str, Dict[str, Any]], None]] = None
+                         ) -> Tuple[Dict[str, Any], Union[Dict[str, Dict[str, Any]], List[Dict[str, Any]]],
+                                    List[Dict[str, Any]], Dict[str, Any], Dict[str, Any]]:
+    """Analyze a session file and return token usage broken down by agent.
+
+    Returns main-session usage, per-subagent usage, skill invocations, raw
+    timing, and the summed usage of all subagents.
+
+    By default every subagent and skill invocation is kept, with repeated
+    results for one agent merged under its agent id. If on_record is given,
+    each subagent result and skill invocation is passed to it (as kind,
+    record) once complete instead of being kept. If top_k is given, only the
+    top_k most expensive subagent results and skill invocations are kept;
+    subagents then come back as a list of individual results (each carrying
+    agent_id), most expensive first, since an agent resumed several times
+    is ranked once per result. top_k requires pricing. Either way memory
+    stays bounded.
+    """
+    if top_k is not None and pricing is None:
+        raise ValueError("top_k needs a pricing table to rank records by cost")
+    bounded = top_k is not None or on_record is not None
+    subagent_heap = []
+    skill_heap = []
+
+    def finish(kind: str, record: Dict[str, Any]) -> None:
+        """Hand a completed subagent result or skill invocation to the bounded sinks."""
+        if top_k is not None:
+            push_top_k(subagent_heap if kind == 'subagent_result' else skill_heap,
+                       top_k, calculate_cost(record, pricing), record)
+        elif on_record is not None:
+            on_record(kind, record)
 
-def analyze_main_session(filepath: str) -> Tuple[Dict[str, Any], Dict[str, Dict[str, Any]]]:
-    """Analyze a session file and return token usage broken down by agent."""
     main_usage = {
         'input_tokens': 0,
         'output_tokens': 0,
         'cache_creation': 0,
         'cache_read': 0,
         'messages': 0,
-        'tool_calls': 0
+        'tool_calls': 0,
+        'by_model': {}
     }
 
     # Track usage per subagent
@@ -37,64 +202,253 @@ def analyze_main_session(filepath: str) -> Tuple[Dict[str, Any], Dict[str, Dict[
         'cache_read': 0,
         'messages': 0,
         'description': None,
-        'type': None
+        'type': None,
+        'duration_seconds': 0.0,
+        'by_model': {}
     })
 
-    # Track skill invocations
+    subagent_totals = empty_usage()
+
+    # Usage and latest model of each running subagent's streamed messages, and
+    # the Task input that started it, keyed by the Task tool_use id
+    subagent_streams = {}
+    task_inputs = {}
+    main_model = None
+
+    def record_subagent(agent_id: str, description: Optional[str], subagent_type: Optional[str],
+                        usage: Dict[str, Any], duration: float) -> None:
+        """Add one finished subagent run to its agent entry and the subagent totals."""
+        # In bounded mode each run is its own record rather than being merged
+        # into a per-agent entry
+        if bounded:
+            agent = {'agent_id': agent_id, **subagent_usage.default_factory()}
+        else:
+            agent = subagent_usage[agent_id]
+
+        if agent['description'] is None:
+            agent['description'] = description[:60] if description else f"agent-{agent_id}"
+            agent['type'] = subagent_type or 'unknown'
+
+        merge_usage(agent, usage)
+        merge_usage(subagent_totals, usage)
+        agent['duration_seconds'] += duration
+        timing['subagent_seconds'] += duration
+
+        if bounded:
+            finish('subagent_result', agent)
+
+    # Track skill invocations. In bounded mode skills are ranked by cost:
+    # main-session usage after a Skill call is attributed to it until the
+    # next Skill call or user prompt, whichever comes first.
     skill_invocations = []
+    current_skill = None
+
+    # Track tool latency and where the main thread's wall-clock time goes.
+    # A gap between consecutive main-thread entries is model time when it ends
+    # in an assistant entry and tool time when it ends in a tool result.
+    pending_tools = {}  # tool_use id -> (tool name, start time)
+    timing = {
+        'tool_latencies': defaultdict(list),
+        'tool_stats': {},
+        'model_seconds': 0.0,
+        'tool_seconds': 0.0,
+        'subagent_seconds': 0.0,
+        'first_ts': None,
+        'last_ts': None
+    }
 
     with open(filepath, 'r') as f:
         for line in f:
             try:
                 data = json.loads(line)
+                ts = parse_timestamp(data.get('timestamp'))
+                is_main_thread = not (data.get('parent_tool_use_id') or data.get('isSidechain'))
+
+                if ts is not None and is_main_thread and data.get('type') in ('assistant', 'user'):
+                    if timing['last_ts'] is None:
+                        timing['first_ts'] = ts
+                    else:
+                        gap = max(ts - timing['last_ts'], 0.0)
+                        if data['type'] == 'assistant':
+                            timing['model_seconds'] += gap
+                        elif tool_use_id_of(data):
+                            timing['tool_seconds'] += gap
+                    timing['last_ts'] = max(ts, timing['last_ts'] or ts)
+
+                # A new user prompt ends the turn a skill's usage is attributed to
+                # (isMeta entries, such as loaded skill content, are not prompts)
+                if current_skill is not None and is_main_thread and data.get('type') == 'user' \
+                        and not data.get('isMeta') and not tool_use_id_of(data):
+                    finish('skill', current_skill)
+                    current_skill = None
+
+                result_latencies = {}  # tool_use id -> latency, for each result in this entry
+                if data.get('type') == 'user':
+                    content = data.get('message', {}).get('content', [])
+                    for block in content if isinstance(content, list) else []:
+                        if isinstance(block, dict) and block.get('type') == 'tool_result':
+                            tool_id = block.get('tool_use_id')
+                            name, started = pending_tools.pop(tool_id, (None, None))
+                            latency = None
+                            if name and started is not None and ts is not None:
+                                latency = max(ts - started, 0.0)
+                                record_latency(timing, name, latency)
+                            result_latencies[tool_id] = latency
 
                 # Main session assistant messages
                 if data.get('type') == 'assistant' and 'message' in data:
-                    main_usage['messages'] += 1
                     msg = data['message']
-                    msg_usage = msg.get('usage', {})
-                    main_usage['input_tokens'] += msg_usage.get('input_tokens', 0)
-                    main_usage['output_tokens'] += msg_usage.get('output_tokens', 0)
-                    main_usage['cache_creation'] += msg_usage.get('cache_creation_input_tokens', 0)
-                    main_usage['cache_read'] += msg_usage.get('cache_read_input_tokens', 0)
+                    model = msg.get('model') or UNKNOWN_MODEL
+
+                    # Messages streamed from inside a subagent are held under the
+                    # Task that started it until its result shows whether
+                    # toolUseResult.usage already accounts for them. Inline
+                    # sidechain entries name no Task, so they are left to the
+                    # toolUseResult of the Task that ran them.
+                    parent_id = data.get('parent_tool_use_id')
+                    if parent_id:
+                        stream = subagent_streams.setdefault(parent_id, {'model': None, 'usage': empty_usage()})
+                        stream['model'] = model
+                        add_usage(stream['usage'], model, msg.get('usage', {}))
+                    elif is_main_thread:
+                        add_usage(main_usage, model, msg.get('usage', {}))
+                        if current_skill is not None:
+                            add_usage(current_skill, model, msg.get('usage', {}))
+                        # Skip placeholders such as <synthetic>
+                        if model != UNKNOWN_MODEL and not model.startswith('<'):
+                            main_model = model
 
                     # Count tool calls
                     content = msg.get('content', [])
                     for block in content:
                         if block.get('type') == 'tool_use':
+                            pending_tools[block.get('id')] = (block.get('name', 'unknown'), ts)
+                            if block.get('name') in ('Task', 'Agent'):
+                                inp = block.get('input', {})
+                                task_inputs[block.get('id')] = (inp.get('description'), inp.get('subagent_type'))
+
+                            # Calls made inside a subagent are not main-session calls
+                            if not is_main_thread:
+                                continue
                             main_usage['tool_calls'] += 1
+
                             # Track skill invocations
                             if block.get('name') == 'Skill':
                                 inp = block.get('input', {})
-                                skill_invocations.append({
+                                if not bounded:
+                                    skill_invocations.append({
+                                        'skill': inp.get('skill'),
+                                        'args': inp.get('args')
+                                    })
+                                    continue
+                                if current_skill is not None:
+                                    finish('skill', current_skill)
+                                current_skill = {
                                     'skill': inp.get('skill'),
-                                    'args': inp.get('args')
-                                })
+                                    'args': inp.get('args'),
+                                    **empty_usage()
+                                }
 
                 # Subagent tool results
-                if data.get('type') == 'user' and 'toolUseResult' in data:
-                    result = data['toolUseResult']
-                    if 'usage' in result and 'agentId' in result:
-                        agent_id = result['agentId']
-                        usage = result['usage']
-
-                        # Get description and type from result
-                        if subagent_usage[agent_id]['description'] is None:
-                            desc = result.get('description', '')
-                            subagent_usage[agent_id]['description'] = desc[:60] if desc else f"agent-{agent_id}"
-                            subagent_usage[agent_id]['type'] = result.get('subagent_type', 'unknown')
-
-                        subagent_usage[agent_id]['messages'] += 1
-                        subagent_usage[agent_id]['input_tokens'] += usage.get('input_tokens', 0)
-                        subagent_usage[agent_id]['output_tokens'] += usage.get('output_tokens', 0)
-                        subagent_usage[agent_id]['cache_creation'] += usage.get('cache_creation_input_tokens', 0)
-                        subagent_usage[agent_id]['cache_read'] += usage.get('cache_read_input_tokens', 0)
+                result = data.get('toolUseResult')
+                if data.get('type') == 'user' and isinstance(result, dict) \
+                        and 'usage' in result and 'agentId' in result:
+                    # The result's usage covers the subagent's streamed messages
+                    tool_id = tool_use_id_of(data)
+                    stream = subagent_streams.pop(tool_id, None)
+                    description, subagent_type = task_inputs.pop(tool_id, (None, None))
+
+                    # Results rarely name their model; fall back to what the
+                    # subagent's own messages reported, then the main model
+                    model = (result.get('model')
+                             or (stream and stream['model'])
+                             or main_model
+                             or UNKNOWN_MODEL)
+                    usage = empty_usage()
+                    add_usage(usage, model, result['usage'])
+
+                    # Prefer the agent's own duration over the Task call latency
+                    if result.get('totalDurationMs') is not None:
+                        duration = result['totalDurationMs'] / 1000
+                    else:
+                        duration = result_latencies.get(tool_id) or 0.0
+                    record_subagent(result['agentId'],
+                                    result.get('description') or description,
+                                    result.get('subagent_type') or subagent_type,
+                                    usage, duration)
+
+                # Without toolUseResult usage (e.g. stream-json output), bill a
+                # finished subagent from its own streamed messages
+                for tool_id, latency in result_latencies.items():
+                    stream = subagent_streams.pop(tool_id, None)
+                    description, subagent_type = task_inputs.pop(tool_id, (None, None))
+                    if stream is not None:
+                        record_subagent(tool_id, description, subagent_type, stream['usage'], latency or 0.0)
             except json.JSONDecodeError:
                 pass
             except Exception:
                 pass
 
-    return main_usage, dict(subagent_usage), skill_invocations
+    # Subagents still running when the session ended (e.g. turn limit reached)
+    for tool_id, stream in subagent_streams.items():
+        description, subagent_type = task_inputs.get(tool_id, (None, None))
+        record_subagent(tool_id, description, subagent_type, stream['usage'], 0.0)
+
+    if current_skill is not None and bounded:
+        finish('skill', current_skill)
+
+    if top_k is not None:
+        # Most expensive first
+        subagent_results = [record for _, _, record in sorted(subagent_heap, reverse=True)]
+        skill_invocations = [record for _, _, record in sorted(skill_heap, reverse=True)]
+        return main_usage, subagent_results, skill_invocations, timing, subagent_totals
+
+    return main_usage, dict(subagent_usage), skill_invocations, timing, subagent_totals
+
+
+def summarize_timing(timing: Dict[str, Any], main_usage: Dict[str, Any]) -> Dict[str, Any]:
+    """Reduce raw timing samples to per-tool percentiles and a time breakdown."""
+    tools = {}
+    for name, stats in timing['tool_stats'].items():
+        latencies = sorted(timing['tool_latencies'][name])
+        tools[name] = {
+            'calls': stats['calls'],
+            'total_seconds': round(stats['total_seconds'], 3),
+            'p50_seconds': round(percentile(latencies, 50), 3),
+            'p95_seconds': round(percentile(latencies, 95), 3),
+            'p99_seconds': round(percentile(latencies, 99), 3),
+            'max_seconds': round(stats['max_seconds'], 3)
+        }
+
+    wall = 0.0
+    if timing['first_ts'] is not None:
+        wall = timing['last_ts'] - timing['first_ts']
+    model_seconds = timing['model_seconds']
+    return {
+        'wall_seconds': round(wall, 3),
+        'model_seconds': round(model_seconds, 3),
+        'tool_seconds': round(timing['tool_seconds'], 3),
+        'subagent_seconds': round(timing['subagent_seconds'], 3),
+        'output_tokens_per_second': round(main_usage['output_tokens'] / model_seconds, 1) if model_seconds else None,
+        'tools': tools
+    }
+
+
+def combine_usage(main_usage: Dict[str, Any], subagent_totals: Dict[str, Any]) -> Dict[str, Any]:
+    """Sum the main session and the summed subagent usage into session totals."""
+    total_usage = {
+        'input_tokens': main_usage['input_tokens'],
+        'output_tokens': main_usage['output_tokens'],
+        'cache_creation': main_usage['cache_creation'],
+        'cache_read': main_usage['cache_read'],
+        'messages': main_usage['messages'],
+        'tool_calls': main_usage.get('tool_calls', 0),
+        'by_model': {}
+    }
+    merge_by_model(total_usage['by_model'], main_usage['by_model'])
+    merge_usage(total_usage, subagent_totals)
+
+    return total_usage
 
 
 def format_tokens(n: int) -> str:
@@ -102,33 +456,80 @@ def format_tokens(n: int) -> str:
     return f"{n:,}"
 
 
-def calculate_cost(usage: Dict[str, int], input_cost_per_m: float = 3.0, output_cost_per_m: float = 15.0) -> float:
-    """Calculate estimated cost in dollars.
+def load_pricing(path: Path) -> Dict[str, Any]:
+    """Load a pricing table (USD per million tokens, keyed by model id)."""
+    with open(path, 'r') as f:
+        pricing = json.load(f)
+    if pricing.get('default') not in pricing.get('models', {}):
+        raise ValueError(f"default model {pricing.get('default')!r} has no rates in {path}")
+    return pricing
+
 
-    Default rates are for Claude Sonnet ($3/$15 per M tokens).
-    For Opus, use input_cost_per_m=15.0, output_cost_per_m=75.0
+def lookup_rates(pricing: Dict[str, Any], model: str) -> Dict[str, float]:
+    """Return the rates for a model id.
+
+    Tries an exact match, then the longest table key that prefixes the id,
+    then the table's default model (warning once per model on stderr).
     """
-    total_input = usage['input_tokens'] + usage['cache_creation'] + usage['cache_read']
-    input_cost = total_input * input_cost_per_m / 1_000_000
-    output_cost = usage['output_tokens'] * output_cost_per_m / 1_000_000
-    return input_cost + output_cost
+    models = pricing['models']
+    if model in models:
+        return models[model]
+    prefixes = [key for key in models if model.startswith(key)]
+    if prefixes:
+        return models[max(prefixes, key=len)]
+    # Placeholders such as <synthetic> carry no usage worth warning about
+    if model not in _defaulted_models and not model.startswith('<'):
+        _defaulted_models.add(model)
+        print(f"Warning: No rates for model {model!r}; pricing it as {pricing['default']}",
+              file=sys.stderr)
+    return models[pricing['default']]
+
+
+def calculate_cost(usage: Dict[str, Any], pricing: Dict[str, Any]) -> float:
+    """Calculate estimated cost in dollars, pricing each model's tokens at its own rates."""
+    cost = 0.0
+    for model, model_usage in usage['by_model'].items():
+        rates = lookup_rates(pricing, model)
+        cost += (model_usage['input_tokens'] * rates['input']
+                 + model_usage['output_tokens'] * rates['output']
+                 + model_usage['cache_creation'] * rates['cache_creation']
+                 + model_usage['cache_read'] * rates['cache_read']) / 1_000_000
+    return cost
+
+
+def with_costs(usage: Dict[str, Any], pricing: Dict[str, Any]) -> Dict[str, Any]:
+    """Copy of usage with estimated_cost_usd set overall and per model."""
+    by_model = {
+        model: {**model_usage, 'estimated_cost_usd': round(calculate_cost({'by_model': {model: model_usage}}, pricing), 4)}
+        for model, model_usage in usage['by_model'].items()
+    }
+    return {**usage, 'by_model': by_model, 'estimated_cost_usd': round(calculate_cost(usage, pricing), 4)}
 
 
-def output_json(main_usage, subagent_usage, skill_invocations, total_usage, total_cost):
+def output_json(main_usage, subagent_usage, skill_invocations, total_usage, pricing, timing):
     """Output analysis as JSON for programmatic consumption."""
-    result = {
-        'main_session': main_usage,
-        'subagents': subagent_usage,
-        'skill_invocations': skill_invocations,
-        'totals': {
-            **total_usage,
-            'estimated_cost_usd': round(total_cost, 4)
-        }
-    }
+    result = {'main_session': with_costs(main_usage, pricing)}
+    if isinstance(subagent_usage, list):
+        result['subagent_results'] = [with_costs(usage, pricing) for usage in subagent_usage]
+    else:
+        result['subagents'] = {agent_id: with_costs(usage, pricing) for agent_id, usage in subagent_usage.items()}
+    result.update({
+        'skill_invocations': [with_costs(inv, pricing) if 'by_model' in inv else inv
+                              for inv in skill_invocations],
+        'timing': timing,
+        'totals': with_costs(total_usage, pricing)
+    })
     print(json.dumps(result, indent=2))
 
 
-def output_table(main_usage, subagent_usage, skill_invocations, total_usage, total_cost):
+def write_record(kind: str, record: Dict[str, Any], pricing: Dict[str, Any]) -> None:
+    """Write one JSON-lines record, costed if it carries token usage."""
+    if 'by_model' in record:
+        record = with_costs(record, pricing)
+    sys.stdout.write(json.dumps({'record': kind, **record}) + '\n')
+
+
+def output_table(main_usage, subagent_usage, skill_invocations, total_usage, pricing, timing):
     """Output analysis as formatted table."""
     print("=" * 110)
     print("TOKEN USAGE ANALYSIS")
@@ -142,7 +543,7 @@ def output_table(main_usage, subagent_usage, skill_invocations, total_usage, tot
     print("-" * 110)
 
     # Main session
-    cost = calculate_cost(main_usage)
+    cost = calculate_cost(main_usage, pricing)
     print(f"{'main':<15} {'coordinator':<12} {'Main session':<30} "
           f"{main_usage['messages']:>5} "
           f"{format_tokens(main_usage['input_tokens']):>12} "
@@ -150,10 +551,13 @@ def output_table(main_usage, subagent_usage, skill_invocations, total_usage, tot
           f"{format_tokens(main_usage['cache_read']):>10} "
           f"${cost:>7.2f}")
 
-    # Subagents (sorted by agent ID)
-    for agent_id in sorted(subagent_usage.keys()):
-        usage = subagent_usage[agent_id]
-        cost = calculate_cost(usage)
+    # Subagents (sorted by agent ID), or individual results ranked by cost with --top
+    if isinstance(subagent_usage, list):
+        rows = [(usage['agent_id'], usage) for usage in subagent_usage]
+    else:
+        rows = sorted(subagent_usage.items())
+    for agent_id, usage in rows:
+        cost = calculate_cost(usage, pricing)
         desc = usage['description'] or f"agent-{agent_id}"
         agent_type = usage.get('type', 'unknown') or 'unknown'
         print(f"{agent_id:<15} {agent_type:<12} {desc:<30} "
@@ -164,6 +568,9 @@ def output_table(main_usage, subagent_usage, skill_invocations, total_usage, tot
               f"${cost:>7.2f}")
 
     print("-" * 110)
+    if isinstance(subagent_usage, list):
+        print(f"Showing the {len(subagent_usage)} most expensive subagent results; "
+              "an agent resumed several times is listed once per result.")
 
     # Skill invocations
     if skill_invocations:
@@ -172,9 +579,24 @@ def output_table(main_usage, subagent_usage, skill_invocations, total_usage, tot
         print("-" * 50)
         for inv in skill_invocations:
             args_str = f" (args: {inv['args']})" if inv.get('args') else ""
-            print(f"  - {inv['skill']}{args_str}")
+            cost_str = f"  ${calculate_cost(inv, pricing):.2f}" if 'by_model' in inv else ""
+            print(f"  - {inv['skill']}{args_str}{cost_str}")
         print("-" * 50)
 
+    # Tool latency
+    if timing['tools']:
+        print()
+        print("Tool Latency (seconds):")
+        print("-" * 80)
+        print(f"{'Tool':<24} {'Calls':>6} {'Total':>10} {'p50':>8} {'p95':>8} {'p99':>8} {'Max':>8}")
+        print("-" * 80)
+        by_total = sorted(timing['tools'].items(), key=lambda item: item[1]['total_seconds'], reverse=True)
+        for name, stats in by_total:
+            print(f"{name:<24} {stats['calls']:>6} {stats['total_seconds']:>10.1f} "
+                  f"{stats['p50_seconds']:>8.2f} {stats['p95_seconds']:>8.2f} "
+                  f"{stats['p99_seconds']:>8.2f} {stats['max_seconds']:>8.2f}")
+        print("-" * 80)
+
     # Calculate totals
     total_input = total_usage['input_tokens'] + total_usage['cache_creation'] + total_usage['cache_read']
     total_tokens = total_input + total_usage['output_tokens']
@@ -191,8 +613,21 @@ def output_table(main_usage, subagent_usage, skill_invocations, total_usage, tot
     print(f"  Total input (incl cache): {format_tokens(total_input)}")
     print(f"  Total tokens:             {format_tokens(total_tokens)}")
     print()
-    print(f"  Estimated cost: ${total_cost:.2f}")
-    print("  (at $3/$15 per M tokens for input/output - Sonnet rates)")
+    if timing['wall_seconds']:
+        throughput = timing['output_tokens_per_second']
+        print(f"  Wall-clock time:        {timing['wall_seconds']:.1f}s")
+        print(f"  Model turn time:        {timing['model_seconds']:.1f}s"
+              + (f" ({throughput:,.1f} output tokens/s)" if throughput else ""))
+        print(f"  Tool execution time:    {timing['tool_seconds']:.1f}s")
+        print(f"  Time in subagents:      {timing['subagent_seconds']:.1f}s")
+        print()
+    print(f"  Estimated cost: ${calculate_cost(total_usage, pricing):.2f}")
+    for model in sorted(total_usage['by_model']):
+        model_cost = calculate_cost({'by_model': {model: total_usage['by_model'][model]}}, pricing)
+        rates = lookup_rates(pricing, model)
+        print(f"    {model:<32} ${model_cost:>8.2f}  "
+              f"(${rates['input']:g}/${rates['output']:g} in/out, "
+              f"${rates['cache_creation']:g}/${rates['cache_read']:g} cache write/read per M)")
     print()
     print("=" * 110)
 
@@ -201,44 +636,61 @@ def main():
     parser = argparse.ArgumentParser(description='Analyze Claude Code session token usage')
     parser.add_argument('session_file', help='Path to session JSONL file')
     parser.add_argument('--json', action='store_true', help='Output as JSON')
-    parser.add_argument('--opus', action='store_true', help='Use Opus pricing ($15/$75 per M)')
+    parser.add_argument('--pricing', default=str(DEFAULT_PRICING_FILE),
+                        help='Pricing table JSON (default: model-pricing.json next to this script)')
+    parser.add_argument('--default-model',
+                        help='Model whose rates apply to entries with no recognised model')
+    parser.add_argument('--stream', action='store_true',
+                        help='Write JSON-lines records as they are aggregated (fixed memory)')
+    parser.add_argument('--top', type=int, metavar='K',
+                        help='Keep only the K most expensive subagents and skill invocations')
     args = parser.parse_args()
 
+    if args.top is not None and args.top < 1:
+        print("Error: --top must be at least 1", file=sys.stderr)
+        sys.exit(1)
+
     if not Path(args.session_file).exists():
         print(f"Error: Session file not found: {args.session_file}", file=sys.stderr)
         sys.exit(1)
 
-    # Analyze the session
-    main_usage, subagent_usage, skill_invocations = analyze_main_session(args.session_file)
+    try:
+        pricing = load_pricing(Path(args.pricing))
+    except (OSError, ValueError) as e:
+        print(f"Error: Could not load pricing table: {e}", file=sys.stderr)
+        sys.exit(1)
+    if args.default_model:
+        if args.default_model not in pricing['models']:
+            print(f"Error: No rates for default model: {args.default_model}", file=sys.stderr)
+            sys.exit(1)
+        pricing['default'] = args.default_model
+
+    # Analyze the session, streaming records out as they complete
+    on_record = None
+    if args.stream and args.top is None:
+        def on_record(kind, record):
+            write_record(kind, record, pricing)
+    main_usage, subagent_usage, skill_invocations, raw_timing, subagent_totals = analyze_main_session(
+        args.session_file, pricing=pricing, top_k=args.top, on_record=on_record)
+    timing = summarize_timing(raw_timing, main_usage)
 
     # Calculate totals
-    total_usage = {
-        'input_tokens': main_usage['input_tokens'],
-        'output_tokens': main_usage['output_tokens'],
-        'cache_creation': main_usage['cache_creation'],
-        'cache_read': main_usage['cache_read'],
-        'messages': main_usage['messages'],
-        'tool_calls': main_usage.get('tool_calls', 0)
-    }
-
-    for usage in subagent_usage.values():
-        total_usage['input_tokens'] += usage['input_tokens']
-        total_usage['output_tokens'] += usage['output_tokens']
-        total_usage['cache_creation'] += usage['cache_creation']
-        total_usage['cache_read'] += usage['cache_read']
-        total_usage['messages'] += usage['messages']
-
-    # Calculate cost
-    if args.opus:
-        total_cost = calculate_cost(total_usage, input_cost_per_m=15.0, output_cost_per_m=75.0)
-    else:
-        total_cost = calculate_cost(total_usage)
+    total_usage = combine_usage(main_usage, subagent_totals)
 
     # Output
-    if args.json:
-        output_json(main_usage, subagent_usage, skill_invocations, total_usage, total_cost)
+    if args.stream:
+        # With --top the kept records are only known at the end, most expensive first
+        for usage in subagent_usage:
+            write_record('subagent_result', usage, pricing)
+        for inv in skill_invocations:
+            write_record('skill', inv, pricing)
+        write_record('main_session', main_usage, pricing)
+        write_record('timing', timing, pricing)
+        write_record('totals', total_usage, pricing)
+    elif args.json:
+        output_json(main_usage, subagent_usage, skill_invocations, total_usage, pricing, timing)
     else:
-        output_table(main_usage, subagent_usage, skill_invocations, total_usage, total_cost)
+        output_table(main_usage, subagent_usage, skill_invocations, total_usage, pricing, timing)
 
 
 if __name__ == '__main__':
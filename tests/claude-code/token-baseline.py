@@ -0,0 +1,295 @@
+#!/usr/bin/env python3
+"""
+Token budget regression gate for cc-plugins test runs.
+
+Aggregates token and message usage per test from one or more test run
+directories, saves those aggregates as a baseline, and compares later runs
+against it. Tests are named <suite>/<test> (e.g. skill-triggering/devloop___devloop),
+so passing several run directories, or the /tmp/cc-plugins-tests root, pools
+every session of a test. Each session is analyzed once in a single process,
+so runs with hundreds of sessions stay fast.
+
+The baseline stores per-model token counts rather than costs; both sides are
+priced with the same table at compare time, so editing the pricing table
+never shows up as a regression. It also records the session files it was
+saved from: compare skips those, and any session written before the baseline,
+so the reference runs are never pooled into the runs being checked.
+
+Usage:
+    python3 token-baseline.py save <baseline.json> <test-dir> [<test-dir> ...]
+    python3 token-baseline.py compare <baseline.json> <test-dir> [<test-dir> ...]
+    python3 token-baseline.py compare --tolerance 10 <baseline.json> <test-dir>
+    python3 token-baseline.py compare --metric-tolerance cost_usd=50 <baseline.json> <test-dir>
+
+Exit status of compare: 0 if every baseline test was run and is within
+tolerance, 1 on any regression, missing test (unless --allow-missing), no
+overlap with the baseline, or error.
+"""
+
+import importlib.util
+import json
+import sys
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, Any, List
+import argparse
+
+SESSION_FILE_NAME = 'claude-output.json'
+DEFAULT_TOLERANCE = 25.0
+
+# Per-session means compared between runs
+METRICS = ['total_tokens', 'output_tokens', 'cost_usd', 'messages']
+
+
+def load_analyzer():
+    """Import analyze-token-usage.py (its file name is not a valid module name)."""
+    path = Path(__file__).with_name('analyze-token-usage.py')
+    spec = importlib.util.spec_from_file_location('analyze_token_usage', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+analyzer = load_analyzer()
+
+
+def test_name_of(session_file: Path) -> str:
+    """Name a session by its <suite>/<test> directories, ignoring the run timestamp."""
+    return '/'.join(session_file.parent.parts[-2:])
+
+
+def find_sessions(test_dirs: List[Path]) -> List[Path]:
+    """Every session file under the given directories, each listed once."""
+    session_files = set()
+    for test_dir in test_dirs:
+        session_files.update(test_dir.resolve().rglob(SESSION_FILE_NAME))
+    return sorted(session_files)
+
+
+def exclude_baseline_sessions(session_files: List[Path], baseline: Dict[str, Any]) -> List[Path]:
+    """Drop sessions the baseline was saved from or that were written before it."""
+    saved_from = set(baseline.get('session_files', []))
+    created = datetime.fromisoformat(baseline['created']).timestamp()
+    return [session_file for session_file in session_files
+            if str(session_file) not in saved_from and session_file.stat().st_mtime >= created]
+
+
+def aggregate_runs(session_files: List[Path]) -> Dict[str, Dict[str, Any]]:
+    """Sum usage of the given sessions, keyed by test name."""
+    tests = {}
+    for session_file in session_files:
+        main_usage, _, _, _, subagent_totals = analyzer.analyze_main_session(str(session_file))
+        total = analyzer.combine_usage(main_usage, subagent_totals)
+
+        agg = tests.setdefault(test_name_of(session_file), {
+            'sessions': 0,
+            'messages': 0,
+            'input_tokens': 0,
+            'output_tokens': 0,
+            'cache_creation': 0,
+            'cache_read': 0,
+            'total_tokens': 0,
+            'by_model': {}
+        })
+        agg['sessions'] += 1
+        agg['messages'] += total['messages']
+        agg['input_tokens'] += total['input_tokens']
+        agg['output_tokens'] += total['output_tokens']
+        agg['cache_creation'] += total['cache_creation']
+        agg['cache_read'] += total['cache_read']
+        agg['total_tokens'] += (total['input_tokens'] + total['cache_creation']
+                                + total['cache_read'] + total['output_tokens'])
+        analyzer.merge_by_model(agg['by_model'], total['by_model'])
+    return tests
+
+
+def per_session(agg: Dict[str, Any], metric: str, pricing: Dict[str, Any]) -> float:
+    """Mean of a metric over the sessions of one test."""
+    if not agg['sessions']:
+        return 0.0
+    if metric == 'cost_usd':
+        return analyzer.calculate_cost(agg, pricing) / agg['sessions']
+    return agg[metric] / agg['sessions']
+
+
+def compare_runs(baseline: Dict[str, Dict[str, Any]], current: Dict[str, Dict[str, Any]],
+                 tolerances: Dict[str, float], pricing: Dict[str, Any],
+                 allow_missing: bool = False) -> List[Dict[str, Any]]:
+    """Compare per-session means of each test against the baseline.
+
+    Increases beyond a metric's tolerance (in percent) are regressions, as
+    are baseline tests absent from the current run unless allow_missing.
+    Tests not in the baseline are reported as new.
+    """
+    rows = []
+    for test_name in sorted(set(baseline) | set(current)):
+        if test_name not in baseline:
+            rows.append({'test': test_name, 'status': 'new'})
+            continue
+        if test_name not in current:
+            rows.append({'test': test_name, 'status': 'skipped' if allow_missing else 'missing'})
+            continue
+        for metric in METRICS:
+            before = per_session(baseline[test_name], metric, pricing)
+            after = per_session(current[test_name], metric, pricing)
+            if before:
+                change = round((after - before) / before * 100, 1)
+                regressed = change > tolerances[metric]
+            else:
+                # Any usage where the baseline had none cannot be expressed in percent
+                change = 0.0 if not after else None
+                regressed = change is None
+            rows.append({
+                'test': test_name,
+                'metric': metric,
+                'baseline': round(before, 4),
+                'current': round(after, 4),
+                'change_pct': change,
+                'tolerance_pct': tolerances[metric],
+                'status': 'regression' if regressed else 'ok'
+            })
+    return rows
+
+
+def is_failure(row: Dict[str, Any]) -> bool:
+    """Whether a comparison row fails the gate."""
+    return row['status'] in ('regression', 'missing')
+
+
+def output_table(rows: List[Dict[str, Any]]) -> None:
+    """Print comparison rows as a table."""
+    print("=" * 100)
+    print("TOKEN BASELINE COMPARISON")
+    print("=" * 100)
+    print(f"{'Test':<40} {'Metric':<14} {'Baseline':>12} {'Current':>12} {'Change':>9} {'Status':>10}")
+    print("-" * 100)
+    for row in rows:
+        if 'metric' not in row:
+            print(f"{row['test']:<40} {'-':<14} {'':>12} {'':>12} {'':>9} {row['status']:>10}")
+            continue
+        change = 'n/a' if row['change_pct'] is None else f"{row['change_pct']:+.1f}%"
+        # Per-session costs are often fractions of a cent
+        spec = ',.4f' if row['metric'] == 'cost_usd' else ',.2f'
+        print(f"{row['test']:<40} {row['metric']:<14} {row['baseline']:>12{spec}} "
+              f"{row['current']:>12{spec}} {change:>9} {row['status']:>10}")
+    print("-" * 100)
+
+    regressions = sum(1 for row in rows if row['status'] == 'regression')
+    missing = sum(1 for row in rows if row['status'] == 'missing')
+    print()
+    if regressions or missing:
+        print(f"FAILED: {regressions} metric(s) over tolerance, {missing} baseline test(s) not run")
+    else:
+        print("PASSED: all tests within tolerance")
+
+
+def parse_tolerances(default: float, overrides: List[str]) -> Dict[str, float]:
+    """Build per-metric tolerances from a default and metric=PCT overrides."""
+    tolerances = {metric: default for metric in METRICS}
+    for override in overrides:
+        metric, sep, value = override.partition('=')
+        if not sep or metric not in tolerances:
+            raise ValueError(f"expected METRIC=PCT with METRIC in {', '.join(METRICS)}: {override}")
+        tolerances[metric] = float(value)
+    return tolerances
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Save or compare per-test token usage baselines')
+    parser.add_argument('mode', choices=['save', 'compare'], help='Save a new baseline or compare against one')
+    parser.add_argument('baseline', help='Path to baseline JSON file')
+    parser.add_argument('test_dirs', nargs='+', metavar='test_dir',
+                        help='Test run output directories, or their parent (e.g. /tmp/cc-plugins-tests)')
+    parser.add_argument('--tolerance', type=float,
+                        help=f'compare: allowed increase in percent for every metric (default: {DEFAULT_TOLERANCE:g})')
+    parser.add_argument('--metric-tolerance', action='append', default=[], metavar='METRIC=PCT',
+                        help=f'compare: override the tolerance for one metric ({", ".join(METRICS)})')
+    parser.add_argument('--allow-missing', action='store_true',
+                        help='compare: do not fail when a baseline test was not run')
+    parser.add_argument('--pricing',
+                        help='compare: pricing table JSON (default: model-pricing.json next to this script)')
+    parser.add_argument('--json', action='store_true', help='compare: output comparison as JSON')
+    args = parser.parse_args()
+
+    if args.mode == 'save':
+        compare_only = [name for name, given in (
+            ('--tolerance', args.tolerance is not None),
+            ('--metric-tolerance', args.metric_tolerance),
+            ('--allow-missing', args.allow_missing),
+            ('--pricing', args.pricing is not None),
+            ('--json', args.json)) if given]
+        if compare_only:
+            print(f"Error: {', '.join(compare_only)} only apply to compare", file=sys.stderr)
+            sys.exit(1)
+
+    test_dirs = [Path(test_dir) for test_dir in args.test_dirs]
+    for test_dir in test_dirs:
+        if not test_dir.is_dir():
+            print(f"Error: Test directory not found: {test_dir}", file=sys.stderr)
+            sys.exit(1)
+
+    if args.mode == 'compare':
+        try:
+            tolerances = parse_tolerances(
+                DEFAULT_TOLERANCE if args.tolerance is None else args.tolerance, args.metric_tolerance)
+            pricing = analyzer.load_pricing(Path(args.pricing or analyzer.DEFAULT_PRICING_FILE))
+        except (OSError, ValueError) as e:
+            print(f"Error: {e}", file=sys.stderr)
+            sys.exit(1)
+
+    session_files = find_sessions(test_dirs)
+    if args.mode == 'save':
+        current = aggregate_runs(session_files)
+        if not current:
+            print(f"Error: No session files found in {', '.join(args.test_dirs)}", file=sys.stderr)
+            sys.exit(1)
+        baseline = {
+            'created': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'sources': [str(test_dir) for test_dir in test_dirs],
+            'session_files': [str(session_file) for session_file in session_files],
+            'tests': current
+        }
+        with open(args.baseline, 'w') as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+            f.write('\n')
+        sessions = sum(agg['sessions'] for agg in current.values())
+        print(f"Saved baseline for {len(current)} test(s), {sessions} session(s) to {args.baseline}")
+        return
+
+    try:
+        with open(args.baseline, 'r') as f:
+            saved = json.load(f)
+        baseline = saved['tests']
+        if not all('by_model' in agg for agg in baseline.values()):
+            raise ValueError("no per-model token counts; save it again")
+        new_sessions = exclude_baseline_sessions(session_files, saved)
+    except (OSError, ValueError, KeyError) as e:
+        print(f"Error: Could not load baseline {args.baseline}: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    current = aggregate_runs(new_sessions)
+    if not current:
+        print(f"Error: No session files newer than the baseline found in {', '.join(args.test_dirs)} "
+              f"({len(session_files)} older or baseline session(s) skipped)", file=sys.stderr)
+        sys.exit(1)
+    skipped = len(session_files) - len(new_sessions)
+    if skipped:
+        print(f"Skipped {skipped} session(s) from or older than the baseline", file=sys.stderr)
+
+    if not set(baseline) & set(current):
+        print(f"Error: None of the {len(current)} test(s) found are in the baseline "
+              f"({len(baseline)} test(s)); nothing to compare", file=sys.stderr)
+        sys.exit(1)
+
+    rows = compare_runs(baseline, current, tolerances, pricing, args.allow_missing)
+    if args.json:
+        print(json.dumps(rows, indent=2))
+    else:
+        output_table(rows)
+
+    if any(is_failure(row) for row in rows):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()